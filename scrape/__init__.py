@@ -3,19 +3,49 @@ __author__ = "Matteo Golin"
 
 # Imports
 import json
-import time
 import csv
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Queue
+from threading import Thread
+import requests
 from progress.bar import PixelBar
-from selenium.webdriver import Chrome
+from selenium.webdriver import Chrome, ChromeOptions
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
+from . import cache
 from .job import Job, JobFactory
 
 # Constants
 CREDS_FILE = "./credentials.json"
 JOB_POSTINGS = "https://mysuccess.carleton.ca/myAccount/co-op/coopjobs.htm"
 CSV_OUTPUT = "./shortlist.csv"
+CHROME_PROFILE = "./chrome_profile"
+JOB_LINKS_SCRIPT = """
+return Array.from(document.querySelectorAll('a[role="button"]'))
+    .filter(button => !["Apply", "New Search"].includes(button.innerText.trim()))
+    .map(button => [button.innerText.trim(), button.href]);
+"""
+WAIT_TIMEOUT = 5  # Seconds
+REQUEST_TIMEOUT = 10  # Seconds
+CSV_BUFFER_SIZE = 1 << 20  # 1 MiB
+CSV_BATCH_SIZE = 16  # Rows
+WORKERS = int(os.getenv("COOP_WORKERS", "4"))
+BLOCKED_RESOURCES = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.css", "*.woff*", "*.svg"]
+CHROME_ARGUMENTS = [
+    "--headless=new",
+    "--window-size=800,600",
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--blink-settings=imagesEnabled=false",
+]
+CHROME_PREFERENCES = {
+    "profile.managed_default_content_settings.images": 2,  # Don't load images
+    "profile.default_content_setting_values.cookies": 1,  # Allow cookies for the session
+}
 CREDENTIAL_STRUCTURE = {
     "credentials": {
         "username": "",
@@ -54,30 +84,138 @@ def check_for_credentials() -> None:
         raise ValueError("Your credentials are empty! Fill them out.")
 
 
+def chrome_options() -> ChromeOptions:
+
+    """Returns the options used to launch every browser."""
+
+    options = ChromeOptions()
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_experimental_option("prefs", CHROME_PREFERENCES)
+
+    return options
+
+
+def block_resources(driver: Chrome) -> None:
+
+    """Stops the browser from loading stylesheets, images and fonts, since only the page source is scraped."""
+
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_RESOURCES})
+
+
+class CSVWriter(Thread):
+
+    """
+    Writes the (index, row) pairs received from its queue until None is received, displaying the progress.
+    Rows are written in index order, holding back those which arrive before their predecessors. A slow early
+    posting can hold back every later row, so memory use is O(N) in the number of postings in the worst case.
+    """
+
+    def __init__(self, file, total: int):
+        super().__init__()
+        self.writer = csv.writer(file)
+        self.total = total
+        self.rows = Queue()
+        self.error: Exception | None = None
+
+    def run(self) -> None:
+
+        bar = PixelBar("Scraping Jobs", max=self.total)
+
+        received_all = False
+        try:
+            # Write the rows in order and in batches
+            pending: dict[int, tuple] = {}
+            next_index = 0
+            batch: list[tuple] = []
+            while (item := self.rows.get()) is not None:
+                index, row = item
+                pending[index] = row
+                bar.next()
+
+                while next_index in pending:
+                    batch.append(pending.pop(next_index))
+                    next_index += 1
+
+                    if len(batch) == CSV_BATCH_SIZE:
+                        self.writer.writerows(batch)
+                        batch.clear()
+
+            received_all = True
+            self.writer.writerows(batch)
+
+            # Rows held back behind a posting which failed to scrape are still written, in order
+            self.writer.writerows(pending[index] for index in sorted(pending))
+
+        except Exception as error:
+            # Keep emptying the queue so the workers never block on a failed writer
+            self.error = error
+            while not received_all and self.rows.get() is not None:
+                pass
+
+        bar.finish()
+
+
+def make_session(cookies: list[dict]) -> requests.Session:
+
+    """Returns an HTTP session authenticated using the browser's session cookies."""
+
+    session = requests.Session()
+    for cookie in cookies:
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie.get("path", "/"))
+
+    return session
+
+
+def scrape_posting(session: requests.Session, index: int, url: str, rows: Queue) -> None:
+
+    """Scrapes the job posting at the URL and sends it to the CSV writer, with its index in the shortlist."""
+
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    # lxml decodes the raw bytes itself, skipping the intermediate string. Only a charset named in the headers is
+    # passed on, since requests otherwise defaults to ISO-8859-1 and would override the page's <meta charset>
+    charset_in_headers = "charset" in response.headers.get("content-type", "").lower()
+    job = JobFactory(response.content, response.encoding if charset_in_headers else None).make_job()
+    cache.save_job(url, response.content, job)
+    rows.put((index, job.to_csv_row()))
+
+
 class Driver:
 
     def __init__(self):
         self.username, self.password = load_credentials()
-        self.driver = Chrome()
-        self.driver.implicitly_wait(4)
+
+        # Persist the session and browser cache between runs
+        options = chrome_options()
+        options.add_argument(f"--user-data-dir={os.path.abspath(CHROME_PROFILE)}")
+        options.add_argument("--profile-directory=Default")
+        self.driver = Chrome(options=options)
 
     def login(self, url) -> None:
 
         """Logs in to the URL, expecting the Carleton SOO Federated Portal."""
 
         self.driver.get(url)
-        self.driver.find_element(By.ID, "userNameInput").send_keys(self.username)
-        self.driver.find_element(By.ID, "passwordInput").send_keys(self.password)
-        self.driver.find_element(By.ID, "submitButton").click()
+
+        # The login form is skipped if still logged in from the last run
+        if self.driver.find_elements(By.ID, "userNameInput"):
+            self.driver.find_element(By.ID, "userNameInput").send_keys(self.username)
+            self.driver.find_element(By.ID, "passwordInput").send_keys(self.password)
+            self.driver.find_element(By.ID, "submitButton").click()
+
+        block_resources(self.driver)
 
     def shortlist(self) -> None:
 
         """Get the job postings board and enter the shortlist."""
 
         self.driver.get("https://mysuccess.carleton.ca/myAccount/co-op/coopjobs.htm")
-        time.sleep(1.5)
-
-        quick_searches = self.driver.find_elements(By.CSS_SELECTOR, "td.full")
+        quick_searches = WebDriverWait(self.driver, WAIT_TIMEOUT).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "td.full"))
+        )
         quick_search_text = [q.text for q in quick_searches]
 
         if "Shortlist" in quick_search_text:
@@ -87,35 +225,47 @@ class Driver:
 
         """Returns a list of the job postings information on the shortlist."""
 
-        buttons = self.driver.find_elements(By.CSS_SELECTOR, 'a[role="button"]')
-
-        job_links = []
-        for button in buttons:
-            if button.text not in ["Apply", "New Search"]:
-                job_links.append(button)
-
-        # Visit each job page and scrape
-        main_tab = self.driver.current_window_handle  # So driver can return
-        bar = PixelBar("Scraping Jobs", max=len(job_links))
-
-        with open(CSV_OUTPUT, 'w', encoding="UTF8", newline="") as file:
-
-            writer = csv.writer(file)
-            writer.writerow(Job.csv_headers())  # Headers
-
-            for link in job_links:
-
-                # Switch to job posting tab
-                link.click()
-                self.driver.switch_to.window(self.driver.window_handles[-1])
-
-                # Scrape the job abd write to the CSV
-                current_job = JobFactory(self.driver.page_source).make_job()
-                writer.writerow(current_job.to_csv_row())
-
-                # Close job posting tab and return to main tab
-                self.driver.close()
-                self.driver.switch_to.window(main_tab)
-                bar.next()
+        WebDriverWait(self.driver, WAIT_TIMEOUT).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'a[role="button"]'))
+        )
 
-        bar.finish()
+        # Filter the buttons in the browser, in one call instead of one per button
+        job_links: list[str] = []
+        for text, href in self.driver.execute_script(JOB_LINKS_SCRIPT):
+            if not href.startswith(("http://", "https://")):
+                raise ValueError(f"Shortlist button '{text}' doesn't link to a job posting URL: '{href}'")
+            job_links.append(href)
+
+        # Only scrape the postings which aren't cached from a recent run
+        cache.prune(job_links)
+        cached_jobs = [cache.load_job(link) for link in job_links]
+        uncached_links = [(index, link) for index, (link, job) in enumerate(zip(job_links, cached_jobs)) if job is None]
+
+        # The postings are server rendered, so they are fetched over HTTP with the browser's session instead
+        session = make_session(self.driver.get_cookies())
+        self.driver.quit()
+
+        # A single thread writes the CSV rows as they are scraped
+        with open(CSV_OUTPUT, 'w', encoding="UTF8", newline="", buffering=CSV_BUFFER_SIZE) as file:
+
+            csv.writer(file).writerow(Job.csv_headers())  # Headers
+            writer = CSVWriter(file, len(job_links))
+            writer.start()
+
+            try:
+                for index, job in enumerate(cached_jobs):
+                    if job is not None:
+                        writer.rows.put((index, job.to_csv_row()))
+
+                with session, ThreadPoolExecutor(WORKERS) as pool:
+                    futures = [
+                        pool.submit(scrape_posting, session, index, link, writer.rows) for index, link in uncached_links
+                    ]
+                    for future in as_completed(futures):
+                        future.result()  # Raise any errors from the workers
+            finally:
+                writer.rows.put(None)  # Stop the writer once every worker is done
+                writer.join()
+
+            if writer.error is not None:
+                raise writer.error
@@ -0,0 +1,73 @@
+# Module for caching scraped job postings between runs
+__author__ = "Matteo Golin"
+
+# Imports
+import json
+import os
+import time
+from hashlib import sha1
+from urllib.parse import parse_qs, urlparse
+
+from .job import Job
+
+# Constants
+CACHE_DIR = "./cache"
+CACHE_LIFETIME = 24 * 60 * 60  # Seconds
+CACHE_EXTENSIONS = (".html", ".json")
+
+
+def posting_key(url: str) -> str:
+
+    """Returns a stable key for the job posting at the URL, preferring its posting ID."""
+
+    query = parse_qs(urlparse(url).query)
+    if "postingId" in query:
+        return query["postingId"][0]
+
+    return sha1(url.encode("UTF8")).hexdigest()
+
+
+def load_job(url: str) -> Job | None:
+
+    """Returns the cached job posting at the URL, or None if it was never cached or is out of date."""
+
+    path = os.path.join(CACHE_DIR, f"{posting_key(url)}.json")
+
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > CACHE_LIFETIME:
+        return None
+
+    # A truncated or outdated entry is scraped again
+    try:
+        with open(path, 'r', encoding="UTF8") as file:
+            return Job.from_dict(json.load(file))
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def save_job(url: str, page_source: bytes, job: Job) -> None:
+
+    """Caches the raw page source and the parsed job posting at the URL."""
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = posting_key(url)
+
+    with open(os.path.join(CACHE_DIR, f"{key}.html"), 'wb') as file:
+        file.write(page_source)
+
+    with open(os.path.join(CACHE_DIR, f"{key}.json"), 'w', encoding="UTF8") as file:
+        json.dump(job.to_dict(), file)
+
+
+def prune(urls: list[str]) -> None:
+
+    """Removes the cached job postings which are no longer on the shortlist."""
+
+    # An empty shortlist is more likely a page that didn't load than one that was cleared
+    if not urls or not os.path.isdir(CACHE_DIR):
+        return
+
+    keys = {posting_key(url) for url in urls}
+    for filename in os.listdir(CACHE_DIR):
+        key, extension = os.path.splitext(filename)
+        if extension in CACHE_EXTENSIONS and key not in keys:
+            os.remove(os.path.join(CACHE_DIR, filename))
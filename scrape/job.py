@@ -2,9 +2,11 @@
 __author__ = "Matteo Golin"
 
 # Imports
-from dataclasses import dataclass
-from bs4 import BeautifulSoup, Tag
+from dataclasses import asdict, dataclass
+from operator import attrgetter
+from lxml import etree, html
 import datetime as dt
+import re
 
 # Constants
 WFH_KEYWORDS: list[str] = ["work from home", "virtual work", "remote work", "hybrid work", "hybrid"]
@@ -22,6 +24,60 @@ FIELD_TITLES = [
     "job description",
     "security screening",
 ]
+_FIELD_TITLES_LOWER = tuple(title.lower() for title in FIELD_TITLES)
+_TITLE_JOB_TITLE = FIELD_TITLES[0]
+_TITLE_POSITION_COUNT = FIELD_TITLES[1]
+_TITLE_LOCATION = FIELD_TITLES[2]
+_TITLE_ARRANGEMENTS = FIELD_TITLES[3]
+_TITLE_WFH = FIELD_TITLES[4]
+_TITLE_DURATION = FIELD_TITLES[5]
+_TITLE_SALARY = FIELD_TITLES[6]
+_TITLE_DESCRIPTION = FIELD_TITLES[9]
+_TITLE_SCREENING = FIELD_TITLES[10]
+_MONTHS = {
+    month: number for number, month in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"],
+        start=1,
+    )
+}
+_DEADLINE_PATTERN = re.compile(r"([a-z]+) (\d{1,2}), (\d{4}) (\d{1,2}):(\d{2}) ([ap]m)", re.IGNORECASE)
+_WFH_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in WFH_KEYWORDS), re.IGNORECASE)
+
+# Compiled XPath queries
+_TABLES = etree.XPath(  # Only the second to fourth tables hold job information
+    "(//table[contains(concat(' ', normalize-space(@class), ' '), ' table ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' table-bordered ')])[position() >= 2 and position() <= 4]"
+)
+_DATA_CELLS = etree.XPath(".//td[@width='75%']")
+_LABEL_CELLS = etree.XPath(".//td[@style='width: 25%;']")
+_DEADLINE = etree.XPath("(.//*[@id='npPostingApplicationInfoDeadlineDate'])[1]")
+
+
+def _parse_deadline(deadline: str) -> dt.datetime:
+
+    """Returns the datetime of a deadline in the format "%B %d, %Y %I:%M %p", without the overhead of strptime."""
+
+    match = _DEADLINE_PATTERN.fullmatch(deadline)
+    if (
+        match is None
+        or match[1].lower() not in _MONTHS
+        or not 1 <= int(match[4]) <= 12
+        or not 0 <= int(match[5]) <= 59
+    ):
+        raise ValueError(f"Deadline '{deadline}' does not match the format '%B %d, %Y %I:%M %p'")
+
+    month, day, year, hour, minute, period = match.groups()
+    hour = int(hour) % 12 + (12 if period.lower() == "pm" else 0)
+
+    return dt.datetime(int(year), _MONTHS[month.lower()], int(day), hour, int(minute))
+
+
+def _get_text(element: html.HtmlElement) -> str:
+
+    """Returns the stripped text of an element, joining each stripped text node."""
+
+    return "".join(text.strip() for text in element.itertext())
 
 
 # Class
@@ -79,49 +135,63 @@ class Job:
 
         """Returns a list of formatted property names belonging to the Job class"""
 
-        headers: list[str] = []
-        for header in cls.__annotations__.keys():
+        return list(_HEADERS)
 
-            if header == "wfh":
-                headers.append(header.upper())
-            else:
-                header = " ".join(header.split("_"))  # No underscores
-                headers.append(header.capitalize())
+    def to_csv_row(self) -> tuple:
+        return _ROW_GETTER(self)
 
-        return headers
+    def to_dict(self) -> dict:
 
-    def to_csv_row(self) -> list:
-        return list(self.__dict__.values())
+        """Returns the job as a JSON serializable dictionary."""
+
+        data = asdict(self)
+        data["deadline"] = self.deadline.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+
+        """Returns the job stored in a dictionary created by to_dict."""
+
+        return cls(**{**data, "deadline": dt.datetime.fromisoformat(data["deadline"])})
+
+
+# The CSV layout is fixed by the Job fields, so it is only formatted once
+_FIELDS = tuple(Job.__dataclass_fields__)
+_HEADERS = tuple(field.upper() if field == "wfh" else field.replace("_", " ").capitalize() for field in _FIELDS)
+_ROW_GETTER = attrgetter(*_FIELDS)
 
 
 # Job factory
 class JobFactory:
 
-    def __init__(self, page_source: str):
+    def __init__(self, page_source: str | bytes, encoding: str | None = None):
 
-        self.html = BeautifulSoup(page_source, features="html.parser")
+        # Raw bytes are decoded with the given encoding, or the page's declared charset if there is none
+        parser = html.HTMLParser(encoding=encoding) if encoding else None
+        self.tree = html.fromstring(page_source, parser=parser)
         job_inf, self.app_inf, self.comp_inf = self.__get_tables()
 
-        # Check for missing fields and remove them from list
-        self.fields = FIELD_TITLES.copy()
+        # Check for missing fields and map the present ones to their row
         self.__set_page_fields(job_inf)
 
-        # Only select the side of the table with data
-        self.job_inf = job_inf.select('td[width="75%"]')
+        # Only select the side of the tables with data, once per page
+        self.job_inf = _DATA_CELLS(job_inf)
+        self.comp_cells = _DATA_CELLS(self.comp_inf)
+        self.deadline_cell = _DEADLINE(self.app_inf)[0]
 
-    def __set_page_fields(self, raw_job_inf: Tag) -> None:
+    def __set_page_fields(self, raw_job_inf: html.HtmlElement) -> None:
 
-        """Removes the fields not contained by the job posting from the fields list."""
+        """Sets the fields contained by the job posting, and the index of each field's row."""
 
-        page_fields = raw_job_inf.select('td[style="width: 25%;"]')
-        page_fields = [f.get_text(strip=True).lower() for f in page_fields]
+        page_fields = _LABEL_CELLS(raw_job_inf)
+        page_fields = [_get_text(f).lower() for f in page_fields]
         page_fields = " ".join(page_fields)
 
-        for _ in range(len(FIELD_TITLES)):
-            if not (FIELD_TITLES[_] in page_fields):
-                self.fields.remove(FIELD_TITLES[_])
+        self.fields = [title for title, lower in zip(FIELD_TITLES, _FIELD_TITLES_LOWER) if lower in page_fields]
+        self.field_index = {title: i for i, title in enumerate(self.fields)}
 
-    def __get_tables(self) -> tuple[Tag, Tag, Tag]:
+    def __get_tables(self) -> tuple[html.HtmlElement, html.HtmlElement, html.HtmlElement]:
         """
         Returns the three tables containing job information in the order:
         1. Job posting information
@@ -129,22 +199,15 @@ class JobFactory:
         3. Company information
         """
 
-        tables = self.html.select(".table.table-bordered")
-
-        job_posting_info = tables[1]
-        application_info = tables[2]
-        company_info = tables[3]
-
+        job_posting_info, application_info, company_info = _TABLES(self.tree)
         return job_posting_info, application_info, company_info
 
     def __get_company_info(self) -> tuple[str, str]:
 
         """Returns company title and division."""
 
-        info_cells = self.comp_inf.select('td[width="75%"]')
-
-        company = info_cells[1].get_text(strip=True)
-        division = info_cells[2].get_text(strip=True)
+        company = _get_text(self.comp_cells[1])
+        division = _get_text(self.comp_cells[2])
 
         return company, division
 
@@ -153,20 +216,19 @@ class JobFactory:
         """Returns the application deadline as a datetime object."""
 
         # Parse
-        raw_deadline = self.app_inf.select("#npPostingApplicationInfoDeadlineDate")[0]
-        parsed_deadline = raw_deadline.get_text(strip=True).replace("\n", "")
+        parsed_deadline = _get_text(self.deadline_cell).replace("\n", "")
         parsed_deadline = " ".join(parsed_deadline.split())
 
         # Convert to datetime
-        deadline = dt.datetime.strptime(parsed_deadline, "%B %d, %Y %I:%M %p")
+        deadline = _parse_deadline(parsed_deadline)
         return deadline
 
     def __get_salary_hours(self) -> tuple[float | None, float | None]:
 
         """Returns the salary as a tuple of the pay rate and hours per week."""
 
-        index = self.fields.index(FIELD_TITLES[6])
-        parsed_salary = self.job_inf[index].get_text(strip=True).replace("$", "")
+        index = self.field_index[_TITLE_SALARY]
+        parsed_salary = _get_text(self.job_inf[index]).replace("$", "")
 
         # Convert to floating point numbers
         salary = []
@@ -191,12 +253,12 @@ class JobFactory:
 
         """Returns the working arrangements of the position."""
 
-        arrangements_index = self.fields.index(FIELD_TITLES[3])
-        arrangements = self.job_inf[arrangements_index].get_text(strip=True)
+        arrangements_index = self.field_index[_TITLE_ARRANGEMENTS]
+        arrangements = _get_text(self.job_inf[arrangements_index])
 
-        if FIELD_TITLES[4] in self.fields:
-            wfh_index = self.fields.index(FIELD_TITLES[4])
-            wfh_arrangements = self.job_inf[wfh_index].get_text(strip=True)
+        if _TITLE_WFH in self.field_index:
+            wfh_index = self.field_index[_TITLE_WFH]
+            wfh_arrangements = _get_text(self.job_inf[wfh_index])
             return f"{arrangements}. {wfh_arrangements}."
 
         return f"{arrangements}."
@@ -205,8 +267,8 @@ class JobFactory:
 
         """Returns the duration of the work term."""
 
-        index = self.fields.index(FIELD_TITLES[5])
-        parsed_duration = self.job_inf[index].get_text(strip=True)
+        index = self.field_index[_TITLE_DURATION]
+        parsed_duration = _get_text(self.job_inf[index])
 
         # I only care if the duration is available in a 4-month term
         if "4" in parsed_duration:
@@ -226,8 +288,8 @@ class JobFactory:
 
         """Returns True if security screening is required for the position."""
 
-        index = self.fields.index(FIELD_TITLES[10])
-        screening = self.job_inf[index].get_text(strip=True)
+        index = self.field_index[_TITLE_SCREENING]
+        screening = _get_text(self.job_inf[index])
 
         if "no" in screening.lower() or "other" in screening.lower():
             return False
@@ -238,18 +300,11 @@ class JobFactory:
 
         """Returns True if mention of WFH is in any other fields."""
 
-        if "virtual" in location.lower() or FIELD_TITLES[4] in self.fields:
+        if "virtual" in location.lower() or _TITLE_WFH in self.field_index:
             return True
 
-        # Process text
-        description = description.lower()
-        arrangements = arrangements.lower()
-
-        for keyword in WFH_KEYWORDS:
-            if keyword in description or keyword in arrangements:
-                return True
-
-        return False
+        # Search for every keyword in a single pass over each field
+        return bool(_WFH_PATTERN.search(description) or _WFH_PATTERN.search(arrangements))
 
     def make_job(self) -> Job:
 
@@ -257,16 +312,16 @@ class JobFactory:
 
         # Easy scrapes
         # Indexes
-        title_index = self.fields.index(FIELD_TITLES[0])
-        positions_index = self.fields.index(FIELD_TITLES[1])
-        location_index = self.fields.index(FIELD_TITLES[2])
-        description_index = self.fields.index(FIELD_TITLES[9])
+        title_index = self.field_index[_TITLE_JOB_TITLE]
+        positions_index = self.field_index[_TITLE_POSITION_COUNT]
+        location_index = self.field_index[_TITLE_LOCATION]
+        description_index = self.field_index[_TITLE_DESCRIPTION]
 
         # Parsing
-        title = self.job_inf[title_index].get_text(strip=True)
-        positions = int(self.job_inf[positions_index].get_text(strip=True))
-        location = self.job_inf[location_index].get_text(strip=True)
-        description = self.job_inf[description_index].get_text(strip=True)
+        title = _get_text(self.job_inf[title_index])
+        positions = int(_get_text(self.job_inf[positions_index]))
+        location = _get_text(self.job_inf[location_index])
+        description = _get_text(self.job_inf[description_index])
 
         # Scrapes handled by functions
         arrangements = self.__get_working_arrangements()